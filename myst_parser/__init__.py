@@ -7,4 +7,8 @@ def setup(app):
     from myst_parser.sphinx_ext.main import setup_sphinx
 
     setup_sphinx(app, load_parser=True)
-    return {"version": __version__, "parallel_read_safe": True}
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -15,7 +15,10 @@ def setup_sphinx(app: Sphinx, load_parser=False):
         SubstitutionReferenceRole,
     )
     from myst_parser.sphinx_ext.mathjax import override_mathjax
-    from myst_parser.sphinx_ext.myst_refs import MystReferenceResolver
+    from myst_parser.sphinx_ext.myst_refs import (
+        MystReferenceResolver,
+        clear_std_index,
+    )
 
     if load_parser:
         app.add_source_suffix(".md", "markdown")
@@ -33,6 +36,7 @@ def setup_sphinx(app: Sphinx, load_parser=False):
 
     app.connect("builder-inited", create_myst_config)
     app.connect("builder-inited", override_mathjax)
+    app.connect("env-updated", clear_std_index)
 
 
 def create_myst_config(app):
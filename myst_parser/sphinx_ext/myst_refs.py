@@ -3,28 +3,141 @@
 This is applied to MyST type references only, such as ``[text](target)``,
 and allows for nested syntax
 """
+import inspect
 import os
-from typing import Any, List, Optional, Tuple, cast
+from functools import lru_cache
+from operator import attrgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
 
 from docutils import nodes
 from docutils.nodes import Element, document
-from sphinx import addnodes, version_info
+from sphinx import addnodes
 from sphinx.addnodes import pending_xref
+from sphinx.application import Sphinx
+from sphinx.builders import Builder
+from sphinx.domains import Domain
 from sphinx.domains.std import StandardDomain
+from sphinx.environment import BuildEnvironment
+from sphinx.errors import ExtensionError, NoUri, SphinxError
 from sphinx.locale import __
 from sphinx.transforms.post_transforms import ReferencesResolver
 from sphinx.util import docname_join, logging
+from sphinx.util.inspect import safe_getattr
+from sphinx.util.logging import is_suppressed_warning
 from sphinx.util.nodes import clean_astext, make_refnode
 
-from myst_parser._compat import findall
+logger = logging.getLogger(__name__)
 
-try:
-    from sphinx.errors import NoUri
-except ImportError:
-    # sphinx < 2.1
-    from sphinx.environment import NoUri  # type: ignore
+# the modname argument of ExtensionError is not available in older sphinx versions
+_EXT_ERROR_MODNAME = "modname" in inspect.signature(ExtensionError).parameters
 
-logger = logging.getLogger(__name__)
+
+def _is_myst_xref(node: nodes.Node) -> bool:
+    """Return whether the node is a pending cross-reference of the "myst" type."""
+    return isinstance(node, addnodes.pending_xref) and node.get("reftype") == "myst"
+
+
+# elements whose content is raw text, so cannot contain any pending_xref
+_NO_XREF_ELEMENTS = (
+    nodes.comment,
+    nodes.doctest_block,
+    nodes.math,
+    nodes.math_block,
+    nodes.raw,
+)
+
+
+def _iter_myst_xrefs(document: nodes.document) -> Iterator[pending_xref]:
+    """Yield all "myst" pending cross-references in the document, in document order.
+
+    This is a flat (non-recursive) traversal, which does not descend into
+    text nodes, raw text elements or the yielded references themselves.
+    It is safe to replace the yielded nodes during iteration.
+    """
+    stack: List[nodes.Node] = [document]
+    while stack:
+        node = stack.pop()
+        if _is_myst_xref(node):
+            yield cast(pending_xref, node)
+        elif isinstance(node, nodes.Element) and not isinstance(
+            node, _NO_XREF_ELEMENTS
+        ):
+            stack.extend(reversed(node.children))
+
+
+def _stringify_candidate(name: str, node: Element) -> str:
+    """Return a string representation of a reference candidate, for warnings."""
+    reftitle = node.get("reftitle")
+    if reftitle is None:
+        reftitle = node.astext()
+    return f":{name}:`{reftitle}`"
+
+
+class _DomainResolver(NamedTuple):
+    """The resolution methods of a (non-std) domain allowed for myst references."""
+
+    name: str
+    module: str
+    resolve_any_xref: Callable[..., List[Tuple[str, Element]]]
+    resolve_xref: Callable[..., Optional[Element]]
+    roles: Tuple[str, ...]
+    supports_any: bool
+    """Whether the domain implements ``resolve_any_xref``."""
+
+
+class _XrefCtx(NamedTuple):
+    """The fields of a "myst" pending cross-reference, as used by the resolvers."""
+
+    node: pending_xref
+    target: str
+    target_lower: str
+    refdoc: str
+    refexplicit: bool
+    get_contnode: Callable[[], Element]
+    """Return the (lazily created) deep copy of the reference's inner node."""
+
+
+# (objtype rank, objtype, "std:role", docname, labelid)
+_StdEntry = Tuple[int, str, str, str, str]
+
+
+@lru_cache(maxsize=8192)
+def _normalize_docname(
+    refdoc: str, target: str, suffixes: Tuple[str, ...]
+) -> Tuple[str, Optional[str]]:
+    """Return the docname for a target relative to ``refdoc``,
+    and the docname with its source suffix stripped (if it has a known one).
+    """
+    docname = docname_join(refdoc, target)
+    root, ext = os.path.splitext(docname)
+    return docname, (root if ext in suffixes else None)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_anchor_path(refdoc: str, rel_path: str) -> Optional[str]:
+    """Return the normalised path of an anchor link's document, relative to ``refdoc``,
+    or ``None`` if the link is to an anchor in ``refdoc`` itself.
+    """
+    rel_path = os.path.normpath(rel_path)
+    if rel_path == ".":
+        return None
+    return os.path.normpath(os.path.join(refdoc, "..", rel_path))
+
+
+def clear_std_index(app: Sphinx, env: BuildEnvironment) -> None:
+    """Clear the cached std object index, after the sources have been read."""
+    env.myst_std_index = None  # type: ignore[attr-defined]
 
 
 class MystReferenceResolver(ReferencesResolver):
@@ -37,35 +150,97 @@ class MystReferenceResolver(ReferencesResolver):
 
     def run(self, **kwargs: Any) -> None:
         self.document: document
-        for node in findall(self.document)(addnodes.pending_xref):
-            if node["reftype"] != "myst":
-                continue
+        # these are constant for the whole doctree, so look them up only once
+        stddomain = cast(StandardDomain, self.env.get_domain("std"))
+        ref_domains = self.env.config.myst_ref_domains
+        std_index = (
+            self._get_std_index(stddomain)
+            if ref_domains is None or "std" in ref_domains
+            else {}
+        )
+        domain_resolvers = [
+            _DomainResolver(
+                domain.name,
+                getattr(domain, "__module__", ""),
+                domain.resolve_any_xref,
+                domain.resolve_xref,
+                tuple(domain.roles),
+                type(domain).resolve_any_xref is not Domain.resolve_any_xref,
+            )
+            for domain in self.env.domains.values()
+            if domain.name != "std"
+            and (ref_domains is None or domain.name in ref_domains)
+        ]
+        heading_anchors = self.env.config.myst_heading_anchors
+        suffixes = tuple(self.env.config.source_suffix)
+        builder = self.app.builder
+        assert builder
+        # the handlers are called directly, rather than via the event manager
+        missing_ref_handlers = [
+            listener.handler
+            for listener in sorted(
+                self.app.events.listeners.get("missing-reference", []),
+                key=attrgetter("priority"),
+            )
+        ]
+
+        # the content node is a deep copy of the reference's inner node,
+        # which is only made if it is actually required by a resolver
+        contnode: Optional[nodes.TextElement] = None
 
-            contnode = cast(nodes.TextElement, node[0].deepcopy())
+        def get_contnode() -> nodes.TextElement:
+            nonlocal contnode
+            if contnode is None:
+                contnode = cast(nodes.TextElement, node[0].deepcopy())
+            return contnode
+
+        # references in a doctree (nearly) all share the same refdoc,
+        # so its source path is only computed once (if required)
+        doc_paths: Dict[str, str] = {}
+
+        # the environment does not change while resolving the doctree,
+        # so targets that failed to resolve once will fail again
+        unresolved: Set[Tuple[str, str, bool]] = set()
+
+        for node in _iter_myst_xrefs(self.document):
+            contnode = None
             newnode = None
 
             target = node["reftarget"]
             refdoc = node.get("refdoc", self.env.docname)
+            refexplicit = bool(node["refexplicit"])
             domain = None
+            unresolved_key = (refdoc, target, refexplicit)
 
             try:
-                newnode = self.resolve_myst_ref(refdoc, node, contnode)
+                if unresolved_key not in unresolved:
+                    ctx = _XrefCtx(
+                        node,
+                        target,
+                        target.lower(),
+                        refdoc,
+                        refexplicit,
+                        get_contnode,
+                    )
+                    newnode = self.resolve_myst_ref(
+                        ctx,
+                        stddomain,
+                        std_index,
+                        domain_resolvers,
+                        builder,
+                        heading_anchors,
+                        suffixes,
+                        doc_paths,
+                    )
                 if newnode is None:
+                    unresolved.add(unresolved_key)
                     # no new node found? try the missing-reference event
                     # but first we change the the reftype to 'any'
                     # this means it is picked up by extensions like intersphinx
                     node["reftype"] = "any"
                     try:
-                        newnode = self.app.emit_firstresult(
-                            "missing-reference",
-                            self.env,
-                            node,
-                            contnode,
-                            **(
-                                {"allowed_exceptions": (NoUri,)}
-                                if version_info[0] > 2
-                                else {}
-                            ),
+                        newnode = self._emit_missing_reference(
+                            missing_ref_handlers, node, get_contnode()
                         )
                     finally:
                         node["reftype"] = "myst"
@@ -79,12 +254,54 @@ class MystReferenceResolver(ReferencesResolver):
                             refdoc, node["reftype"], target, node, domain
                         )
             except NoUri:
-                newnode = contnode
+                newnode = get_contnode()
+
+            node.replace_self(newnode or get_contnode())
+
+    def _emit_missing_reference(
+        self, handlers: List[Callable], node: pending_xref, contnode: Element
+    ) -> Optional[Element]:
+        """Return the first result of the ``missing-reference`` event handlers.
 
-            node.replace_self(newnode or contnode)
+        This is the same as ``app.emit_firstresult("missing-reference", ...)``,
+        but for a pre-fetched list of handlers,
+        and stops calling them once one has returned a result.
+        """
+        # the error handling mirrors ``sphinx.events.EventManager.emit``,
+        # and should be kept in sync with it
+        # (``app.pdb`` and the ``modname`` argument only exist in newer sphinx versions)
+        for handler in handlers:
+            try:
+                result = handler(self.app, self.env, node, contnode)
+            except SphinxError:
+                # this includes NoUri
+                raise
+            except Exception as exc:
+                if getattr(self.app, "pdb", False):
+                    raise
+                kwargs = {}
+                if _EXT_ERROR_MODNAME:
+                    kwargs["modname"] = safe_getattr(handler, "__module__", None)
+                raise ExtensionError(
+                    __("Handler %r for event %r threw an exception")
+                    % (handler, "missing-reference"),
+                    exc,
+                    **kwargs,
+                ) from exc
+            if result is not None:
+                return result
+        return None
 
     def resolve_myst_ref(
-        self, refdoc: str, node: pending_xref, contnode: Element
+        self,
+        ctx: _XrefCtx,
+        stddomain: StandardDomain,
+        std_index: Dict[str, List[_StdEntry]],
+        domain_resolvers: List[_DomainResolver],
+        builder: Builder,
+        heading_anchors: Optional[int],
+        suffixes: Tuple[str, ...],
+        doc_paths: Dict[str, str],
     ) -> Element:
         """Resolve reference generated by the "myst" role; ``[text](reference)``.
 
@@ -96,10 +313,13 @@ class MystReferenceResolver(ReferencesResolver):
           ``[**nested**](reference)``
 
         """
-        target = node["reftarget"]  # type: str
+        node, target, target_lower, refdoc, _, get_contnode = ctx
         results = []  # type: List[Tuple[str, Element]]
 
-        res_anchor = self._resolve_anchor(node, refdoc)
+        res_anchor = None
+        if heading_anchors is not None and "#" in target:
+            # if no target anchors will have been created, we don't look for them
+            res_anchor = self._resolve_anchor(ctx, stddomain, builder, doc_paths)
         if res_anchor:
             results.append(("std:doc", res_anchor))
         else:
@@ -107,75 +327,65 @@ class MystReferenceResolver(ReferencesResolver):
             # don't search in the std:ref/std:doc (leads to duplication)
 
             # resolve standard references
-            res = self._resolve_ref_nested(node, refdoc)
+            res = self._resolve_ref_nested(ctx, stddomain, builder, target_lower)
             if res:
                 results.append(("std:ref", res))
 
             # resolve doc names
-            res = self._resolve_doc_nested(node, refdoc)
+            res = self._resolve_doc_nested(ctx, builder, suffixes)
             if res:
                 results.append(("std:doc", res))
 
-        # get allowed domains for referencing
-        ref_domains = self.env.config.myst_ref_domains
-
-        assert self.app.builder
-
         # next resolve for any other standard reference objects
-        if ref_domains is None or "std" in ref_domains:
-            stddomain = cast(StandardDomain, self.env.get_domain("std"))
-            for objtype in stddomain.object_types:
-                key = (objtype, target)
-                if objtype == "term":
-                    key = (objtype, target.lower())
-                if key in stddomain.objects:
-                    docname, labelid = stddomain.objects[key]
-                    domain_role = "std:" + stddomain.role_for_objtype(objtype)
-                    ref_node = make_refnode(
-                        self.app.builder, refdoc, docname, labelid, contnode
-                    )
-                    results.append((domain_role, ref_node))
+        # (terms are stored lower-cased, all other object types are case-sensitive)
+        entries = [e for e in std_index.get(target, ()) if e[1] != "term"]
+        terms = [e for e in std_index.get(target_lower, ()) if e[1] == "term"]
+        if terms:
+            entries = sorted(entries + terms)
+        for _, _, domain_role, docname, labelid in entries:
+            ref_node = make_refnode(builder, refdoc, docname, labelid, get_contnode())
+            results.append((domain_role, ref_node))
 
         # finally resolve for any other type of allowed reference domain
-        for domain in self.env.domains.values():
-            if domain.name == "std":
-                continue  # we did this one already
-            if ref_domains is not None and domain.name not in ref_domains:
-                continue
-            try:
-                results.extend(
-                    domain.resolve_any_xref(
-                        self.env, refdoc, self.app.builder, target, node, contnode
+        for domain in domain_resolvers:
+            if domain.supports_any:
+                try:
+                    results.extend(
+                        domain.resolve_any_xref(
+                            self.env, refdoc, builder, target, node, get_contnode()
+                        )
                     )
+                    continue
+                except NotImplementedError:
+                    # an override may still defer to the base implementation
+                    pass
+            # the domain doesn't yet support the new interface
+            # we have to manually collect possible references (SLOW)
+            if not domain.module.startswith("sphinx."):
+                logger.warning(
+                    f"Domain '{domain.module}::{domain.name}' has not "
+                    "implemented a `resolve_any_xref` method [myst.domains]",
+                    type="myst",
+                    subtype="domains",
+                    once=True,
                 )
-            except NotImplementedError:
-                # the domain doesn't yet support the new interface
-                # we have to manually collect possible references (SLOW)
-                if not (getattr(domain, "__module__", "").startswith("sphinx.")):
-                    logger.warning(
-                        f"Domain '{domain.__module__}::{domain.name}' has not "
-                        "implemented a `resolve_any_xref` method [myst.domains]",
-                        type="myst",
-                        subtype="domains",
-                        once=True,
-                    )
-                for role in domain.roles:
-                    res = domain.resolve_xref(
-                        self.env, refdoc, self.app.builder, role, target, node, contnode
-                    )
-                    if res and len(res) and isinstance(res[0], nodes.Element):
-                        results.append((f"{domain.name}:{role}", res))
+            for role in domain.roles:
+                res = domain.resolve_xref(
+                    self.env, refdoc, builder, role, target, node, get_contnode()
+                )
+                if res and len(res) and isinstance(res[0], nodes.Element):
+                    results.append((f"{domain.name}:{role}", res))
 
         # now, see how many matches we got...
         if not results:
             return None
-        if len(results) > 1:
-
-            def stringify(name, node):
-                reftitle = node.get("reftitle", node.astext())
-                return f":{name}:`{reftitle}`"
-
-            candidates = " or ".join(stringify(name, role) for name, role in results)
+        if len(results) > 1 and not is_suppressed_warning(
+            "myst", "ref", self.env.config.suppress_warnings
+        ):
+            # only build the message if the warning will actually be emitted
+            candidates = " or ".join(
+                _stringify_candidate(name, role) for name, role in results
+            )
             logger.warning(
                 __(
                     f"more than one target found for 'myst' cross-reference {target}: "
@@ -189,68 +399,120 @@ class MystReferenceResolver(ReferencesResolver):
         res_role, newnode = results[0]
         # Override "myst" class with the actual role type to get the styling
         # approximately correct.
-        res_domain = res_role.split(":")[0]
         if len(newnode) > 0 and isinstance(newnode[0], nodes.Element):
-            newnode[0]["classes"] = newnode[0].get("classes", []) + [
-                res_domain,
-                res_role.replace(":", "-"),
-            ]
+            res_domain = res_role.partition(":")[0]
+            res_classes = (res_domain, res_role.replace(":", "-"))
+            classes = newnode[0].get("classes")
+            if classes is None:
+                newnode[0]["classes"] = list(res_classes)
+            else:
+                classes.extend(res_classes)
 
         return newnode
 
+    def _get_std_index(self, stddomain: StandardDomain) -> Dict[str, List[_StdEntry]]:
+        """Return a mapping of std domain object names to their entries.
+
+        The entries for each name are ordered by ``stddomain.object_types``.
+        The index is cached on the environment, until it is cleared by
+        ``clear_std_index`` once the (possibly changed) sources have been read.
+        """
+        cached = getattr(self.env, "myst_std_index", None)
+        if cached is not None:
+            return cached
+        objtype_roles = {
+            objtype: (rank, f"std:{stddomain.role_for_objtype(objtype)}")
+            for rank, objtype in enumerate(stddomain.object_types)
+        }
+        index: Dict[str, List[_StdEntry]] = {}
+        for (objtype, name), (docname, labelid) in stddomain.objects.items():
+            if objtype not in objtype_roles:
+                continue
+            rank, domain_role = objtype_roles[objtype]
+            index.setdefault(name, []).append(
+                (rank, objtype, domain_role, docname, labelid)
+            )
+        for entries in index.values():
+            entries.sort()
+        self.env.myst_std_index = index  # type: ignore[attr-defined]
+        return index
+
+    def _get_title_text(self, docname: str) -> str:
+        """Return the cleaned text of a document's title.
+
+        The text is cached on the environment, for as long as the title is unchanged.
+        """
+        title = self.env.titles[docname]
+        cache: Optional[Dict[str, Tuple[nodes.title, str]]] = getattr(
+            self.env, "myst_title_texts", None
+        )
+        if cache is None:
+            cache = self.env.myst_title_texts = {}  # type: ignore[attr-defined]
+        cached = cache.get(docname)
+        if cached is not None and cached[0] is title:
+            return cached[1]
+        text = clean_astext(title)
+        cache[docname] = (title, text)
+        return text
+
     def _resolve_anchor(
-        self, node: pending_xref, fromdocname: str
+        self,
+        ctx: _XrefCtx,
+        stddomain: StandardDomain,
+        builder: Builder,
+        doc_paths: Dict[str, str],
     ) -> Optional[Element]:
-        """Resolve doc with anchor."""
-        if self.env.config.myst_heading_anchors is None:
-            # no target anchors will have been created, so we don't look for them
-            return None
-        target = node["reftarget"]  # type: str
-        if "#" not in target:
-            return None
+        """Resolve doc with anchor, for a target containing ``#``.
+
+        ``doc_paths`` is a memo of refdoc to source path, shared across the doctree.
+        """
         # the link may be a heading anchor; we need to first get the relative path
-        rel_path, anchor = target.rsplit("#", 1)
-        rel_path = os.path.normpath(rel_path)
-        if rel_path == ".":
+        rel_path, _, anchor = ctx.target.rpartition("#")
+        doc_path = _normalize_anchor_path(ctx.refdoc, rel_path)
+        if doc_path is None:
             # anchor in the same doc as the node
-            doc_path = self.env.doc2path(node.get("refdoc", fromdocname), base=False)
-        else:
-            # anchor in a different doc from the node
-            doc_path = os.path.normpath(
-                os.path.join(node.get("refdoc", fromdocname), "..", rel_path)
-            )
-        return self._resolve_ref_nested(node, fromdocname, doc_path + "#" + anchor)
+            doc_path = doc_paths.get(ctx.refdoc)
+            if doc_path is None:
+                doc_path = doc_paths[ctx.refdoc] = self.env.doc2path(
+                    ctx.refdoc, base=False
+                )
+        return self._resolve_ref_nested(
+            ctx, stddomain, builder, doc_path + "#" + anchor
+        )
 
     def _resolve_ref_nested(
-        self, node: pending_xref, fromdocname: str, target=None
+        self,
+        ctx: _XrefCtx,
+        stddomain: StandardDomain,
+        builder: Builder,
+        target: str,
     ) -> Optional[Element]:
         """This is the same as ``sphinx.domains.std._resolve_ref_xref``,
         but allows for nested syntax, rather than converting the inner node to raw text.
-        """
-        stddomain = cast(StandardDomain, self.env.get_domain("std"))
-        target = target or node["reftarget"].lower()
 
-        if node["refexplicit"]:
+        The caller is responsible for any case normalisation of ``target``.
+        """
+        if ctx.refexplicit:
             # reference to anonymous label; the reference uses
             # the supplied link caption
             docname, labelid = stddomain.anonlabels.get(target, ("", ""))
-            sectname = node.astext()
+            if not docname:
+                return None
+            sectname = ctx.node.astext()
             innernode = nodes.inline(sectname, "")
-            innernode.extend(node[0].children)
+            innernode.extend(ctx.node[0].children)
         else:
             # reference to named label; the final node will
             # contain the section name after the label
             docname, labelid, sectname = stddomain.labels.get(target, ("", "", ""))
+            if not docname:
+                return None
             innernode = nodes.inline(sectname, sectname)
 
-        if not docname:
-            return None
-
-        assert self.app.builder
-        return make_refnode(self.app.builder, fromdocname, docname, labelid, innernode)
+        return make_refnode(builder, ctx.refdoc, docname, labelid, innernode)
 
     def _resolve_doc_nested(
-        self, node: pending_xref, fromdocname: str
+        self, ctx: _XrefCtx, builder: Builder, suffixes: Tuple[str, ...]
     ) -> Optional[Element]:
         """This is the same as ``sphinx.domains.std._resolve_doc_xref``,
         but allows for nested syntax, rather than converting the inner node to raw text.
@@ -258,25 +520,22 @@ class MystReferenceResolver(ReferencesResolver):
         It also allows for extensions on document names.
         """
         # directly reference to document by source name; can be absolute or relative
-        refdoc = node.get("refdoc", fromdocname)
-        docname = docname_join(refdoc, node["reftarget"])
+        docname, stripped = _normalize_docname(ctx.refdoc, ctx.target, suffixes)
 
         if docname not in self.env.all_docs:
             # try stripping known extensions from doc name
-            if os.path.splitext(docname)[1] in self.env.config.source_suffix:
-                docname = os.path.splitext(docname)[0]
-            if docname not in self.env.all_docs:
+            if stripped is None or stripped not in self.env.all_docs:
                 return None
+            docname = stripped
 
-        if node["refexplicit"]:
+        if ctx.refexplicit:
             # reference with explicit title
-            caption = node.astext()
+            caption = ctx.node.astext()
             innernode = nodes.inline(caption, "", classes=["doc"])
-            innernode.extend(node[0].children)
+            innernode.extend(ctx.node[0].children)
         else:
             # TODO do we want nested syntax for titles?
-            caption = clean_astext(self.env.titles[docname])
+            caption = self._get_title_text(docname)
             innernode = nodes.inline(caption, caption, classes=["doc"])
 
-        assert self.app.builder
-        return make_refnode(self.app.builder, fromdocname, docname, "", innernode)
+        return make_refnode(builder, ctx.refdoc, docname, "", innernode)